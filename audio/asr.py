@@ -1,15 +1,58 @@
 import asyncio
-import json
+import re
 import uuid
 import gzip
+import zlib
 import logging
 import websockets
 import struct
 import os
+import orjson
 from typing import AsyncGenerator
+from core.queues import ClosableQueue, QueueShutDown
 
 logger = logging.getLogger("audio.asr")
 
+# 在原始字节上直取 result.text，跳过整包 JSON 解析（响应里只消费这一个字段）。
+# 锚定在 "result" 对象的开头：utterances 里每个分句也带 "text" 字段，
+# 且 JSON 键序无契约保证，裸匹配 "text" 可能抓到分句片段。
+# result.text 不是首键时正则落空，走下面的整包解析兜底
+_TEXT_RE = re.compile(rb'"result"\s*:\s*\{\s*"text"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _parse_asr_text(payload: bytes) -> str:
+    """
+    提取 result.text。
+    热路径：正则直取字段字节，无转义序列时直接解码；
+    否则退回 orjson 整包解析（仍比标准库 json 快数倍）。
+    """
+    m = _TEXT_RE.search(payload)
+    if m:
+        raw = m.group(1)
+        # 含反斜杠转义 (\uXXXX 等) 时不能直接按 UTF-8 解码，走完整解析
+        if b'\\' not in raw:
+            return raw.decode('utf-8')
+    resp = orjson.loads(payload)
+    result = resp.get('result')
+    if isinstance(result, dict):
+        return result.get('text', '')
+    return ''
+
+def _construct_header(msg_type, flag, serialization, compression):
+    header = bytearray()
+    header.append((0b0001 << 4) | 1) # Version=1, HeaderSize=1
+    header.append((msg_type << 4) | flag)
+    header.append((serialization << 4) | compression)
+    header.append(0x00)
+    return bytes(header)
+
+
+# 各消息类型的静态头部：输入恒定，进程内只构造一次
+_HDR_INIT = _construct_header(0b0001, 0b0001, 0b0001, 0b0001)        # 握手 (JSON + gzip)
+_HDR_AUDIO = _construct_header(0b0010, 0b0001, 0b0000, 0b0000)       # 音频帧 (裸 PCM)
+_HDR_AUDIO_LAST = _construct_header(0b0010, 0b0011, 0b0000, 0b0000)  # 结束包
+
+
 class DoubaoASR:
     def __init__(self):
         self.appid = os.getenv("VOLC_APPID")
@@ -17,21 +60,24 @@ class DoubaoASR:
         self.resource_id = os.getenv("VOLC_ASR_RESOURCE_ID", "volc.bigasr.sauc.duration")
         self.url = "wss://openspeech.bytedance.com/api/v3/sauc/bigmodel_async"
         self.sequence = 1
+        # 预分配音频帧发送缓冲: Header(4) + Sequence(4) + PayloadSize(4)。
+        # 静态头部只构造一次，热路径上仅用 pack_into 改写序号和长度两个字段，
+        # 避免每帧三次 struct.pack 加一次 bytes 拼接的小对象分配。
+        self._send_buf = bytearray(12)
+        self._send_buf[0:4] = _HDR_AUDIO
 
-    def _construct_header(self, msg_type, flag, serialization, compression):
-        header = bytearray()
-        header.append((0b0001 << 4) | 1) # Version=1, HeaderSize=1
-        header.append((msg_type << 4) | flag)
-        header.append((serialization << 4) | compression)
-        header.append(0x00)
-        return bytes(header)
-
-    async def recognize_stream(self, audio_generator: AsyncGenerator[bytes, None]) -> AsyncGenerator[str, None]:
+    async def recognize_stream(self, audio_source) -> AsyncGenerator[str, None]:
         """
         实时语音识别生成器。
+
+        Args:
+            audio_source: 音频帧来源。既可以是异步生成器，也可以直接传入
+                ClosableQueue（以 shutdown() 结束）——后者让发送循环直接
+                消费队列，省掉包装生成器带来的每帧一次协程切换。
         Yields:
             str: 实时更新的转录文本 (Cumulative text)
         """
+        from_queue = isinstance(audio_source, asyncio.Queue)
         headers = {
             "X-Api-App-Key": self.appid,
             "X-Api-Access-Key": self.token,
@@ -40,8 +86,10 @@ class DoubaoASR:
         }
 
         self.sequence = 1
+        # 恢复音频帧头部 (上一轮的结束包会改写 flag 位)
+        self._send_buf[0:4] = _HDR_AUDIO
         # 用于在接收协程和主生成器之间传递文本结果
-        text_queue = asyncio.Queue()
+        text_queue = ClosableQueue()
         
         # 握手包 Payload
         req_id = str(uuid.uuid4())
@@ -67,13 +115,14 @@ class DoubaoASR:
         }
 
         try:
-            async with websockets.connect(self.url, additional_headers=headers, ping_interval=None) as ws:
+            # compression=None: 音频帧是裸 PCM、服务端响应已是 gzip 负载，
+            # 再套一层 permessage-deflate 只会白烧 CPU
+            async with websockets.connect(self.url, additional_headers=headers, ping_interval=None, compression=None) as ws:
                 logger.info("ASR 已连接，握手包已发送。")
                 
                 # 1. 发送握手
-                payload_compressed = gzip.compress(json.dumps(init_payload).encode('utf-8'))
-                header = self._construct_header(0b0001, 0b0001, 0b0001, 0b0001)
-                await ws.send(header + struct.pack('>i', self.sequence) + struct.pack('>I', len(payload_compressed)) + payload_compressed)
+                payload_compressed = gzip.compress(orjson.dumps(init_payload))  # orjson 直接产出 bytes，免中间 str + 编码
+                await ws.send(_HDR_INIT + struct.pack('>i', self.sequence) + struct.pack('>I', len(payload_compressed)) + payload_compressed)
                 self.sequence += 1
 
                 # 2. 接收任务 (Producer)
@@ -92,22 +141,25 @@ class DoubaoASR:
                             
                             if msg_type == 0b1001: # Server Response
                                 if len(msg) < offset + 4: continue
-                                payload_size = struct.unpack('>I', msg[offset:offset+4])[0]
+                                payload_size = struct.unpack_from('>I', msg, offset)[0]
                                 offset += 4
-                                payload_data = msg[offset : offset + payload_size]
-                                
+                                # memoryview 切片零拷贝，直接交给解压器
+                                payload_data = memoryview(msg)[offset : offset + payload_size]
+
                                 if compression == 0b0001: # GZIP
-                                    try: payload_data = gzip.decompress(payload_data)
+                                    # wbits=31 直走 zlib 的 gzip 容器解码，
+                                    # 省掉 gzip 模块的 Python 层封装，且原生吃 memoryview
+                                    try: payload_data = zlib.decompress(payload_data, 31)
                                     except: continue
+                                else:
+                                    payload_data = bytes(payload_data)
                                 
                                 try:
-                                    resp = json.loads(payload_data)
-                                    if 'result' in resp and 'text' in resp['result']:
-                                        text = resp['result']['text'].strip()
-                                        if text:
-                                            # Put cumulative text into queue
-                                            await text_queue.put(text)
-                                            # logger.debug(f"分段文本: {text}")
+                                    text = _parse_asr_text(payload_data).strip()
+                                    if text:
+                                        # Put cumulative text into queue
+                                        await text_queue.put(text)
+                                        # logger.debug(f"分段文本: {text}")
                                 except: pass
                             elif msg_type == 0b1111: # 错误响应
                                 logger.error("ASR 服务端返回错误类型消息")
@@ -115,25 +167,36 @@ class DoubaoASR:
                     except Exception as e:
                         logger.error(f"ASR 接收异常: {e}")
                     finally:
-                        await text_queue.put(None) # 结束标记
+                        text_queue.shutdown() # 通知主循环结束
 
                 recv_task = asyncio.create_task(receive_loop())
 
                 # 3. 发送任务 (Producer)
+                # 音频帧直接裸发 (compression=0b0000)：PCM 对 gzip 几乎不可压缩，
+                # 每帧 20-40ms 调一次 gzip.compress 纯粹是热路径上的 CPU 开销。
                 async def send_loop():
                     try:
-                        async for chunk in audio_generator:
+                        gen = None if from_queue else audio_source.__aiter__()
+                        while True:
+                            if from_queue:
+                                try:
+                                    chunk = await audio_source.get()
+                                except QueueShutDown:
+                                    break
+                            else:
+                                try:
+                                    chunk = await gen.__anext__()
+                                except StopAsyncIteration:
+                                    break
                             if not chunk: continue
-                            compressed_chunk = gzip.compress(chunk)
-                            header = self._construct_header(0b0010, 0b0001, 0b0000, 0b0001)
-                            pkg = header + struct.pack('>i', self.sequence) + struct.pack('>I', len(compressed_chunk)) + compressed_chunk
-                            await ws.send(pkg)
+                            struct.pack_into('>iI', self._send_buf, 4, self.sequence, len(chunk))
+                            await ws.send(bytes(self._send_buf) + chunk)
                             self.sequence += 1
-                        
-                        # 发送结束包
-                        last_header = self._construct_header(0b0010, 0b0011, 0b0000, 0b0001)
-                        last_pkg = last_header + struct.pack('>i', -self.sequence) + struct.pack('>I', 0) + gzip.compress(b'')
-                        await ws.send(last_pkg)
+
+                        # 发送结束包 (空负载)，复用同一缓冲，仅 flag 位不同
+                        self._send_buf[0:4] = _HDR_AUDIO_LAST
+                        struct.pack_into('>iI', self._send_buf, 4, -self.sequence, 0)
+                        await ws.send(bytes(self._send_buf))
                         logger.info("ASR 音频发送完成。")
                     except Exception as e:
                         logger.error(f"ASR 发送任务异常: {e}")
@@ -142,9 +205,9 @@ class DoubaoASR:
 
                 # 4. 主循环：将结果 yield 给调用方
                 while True:
-                    # 等待文本结果
-                    text = await text_queue.get()
-                    if text is None: # 接收循环结束
+                    try:
+                        text = await text_queue.get()
+                    except QueueShutDown: # 接收循环结束
                         break
                     yield text
                 
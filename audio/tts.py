@@ -1,14 +1,29 @@
 import asyncio
-import json
 import uuid
 import gzip
+import zlib
 import logging
+import struct
 import websockets
 import os
+import orjson
 from typing import AsyncGenerator
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger("audio.tts")
 
+# Seq(int32) + Size(uint32)，预编译一次，热路径单次 unpack_from 取两个字段
+_FRAME_HDR = struct.Struct('>iI')
+
+# 音频块解压放线程池：解几十 KB 的 PCM 要 1-2ms，zlib 的 C 代码会释放 GIL，
+# 挪出事件循环可避免抖动其他协程 (ASR 收发、websocket ping)
+_inflate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts-inflate")
+
+
+def _gunzip(buf):
+    # wbits=31: zlib 直接解 gzip 容器，免 gzip 模块封装开销
+    return zlib.decompress(buf, 31)
+
 class DoubaoTTS:
     def __init__(self):
         self.appid = os.getenv("VOLC_APPID")
@@ -16,15 +31,34 @@ class DoubaoTTS:
         self.cluster = os.getenv("VOLC_TTS_CLUSTER", "volcano_tts")
         self.voice_type = os.getenv("VOLC_TTS_VOICE_TYPE", "zh_female_cancan_mars_bigtts")
         self.url = "wss://openspeech.bytedance.com/api/v1/tts/ws_binary"
+        # 空闲连接池：TLS + WS 握手约 100ms，能复用就复用。
+        # 服务端若在合成结束后关闭连接，取用时会按状态丢弃并新建。
+        self._idle = []
+
+    async def _acquire(self):
+        while self._idle:
+            ws = self._idle.pop()
+            if ws.close_code is None:
+                return ws
+            # 已被服务端关闭的连接直接丢弃
+        return await websockets.connect(
+            self.url,
+            additional_headers={"Authorization": f"Bearer;{self.token}"},
+            # compression=None: 音频负载本身已是 gzip，免去二次 deflate
+            compression=None
+        )
+
+    async def aclose(self):
+        """关闭池中所有空闲连接"""
+        while self._idle:
+            ws = self._idle.pop()
+            try: await ws.close()
+            except: pass
 
     async def synthesize_stream(self, text: str) -> AsyncGenerator[bytes, None]:
         """
         [V1 协议] 文本转语音流式合成。
         """
-        headers = {
-            "Authorization": f"Bearer;{self.token}"
-        }
-        
         req_id = str(uuid.uuid4())
         payload = {
             "app": {
@@ -50,46 +84,63 @@ class DoubaoTTS:
         }
 
         try:
-            async with websockets.connect(self.url, additional_headers=headers) as ws:
-                header = b'\x11\x10\x11\x00' # Gzip
-                payload_bytes = gzip.compress(json.dumps(payload).encode('utf-8'))
-                payload_size = len(payload_bytes).to_bytes(4, 'big')
-                
-                await ws.send(header + payload_size + payload_bytes)
-                
-                while True:
-                    msg = await ws.recv()
-                    if len(msg) < 4: continue
-                    
-                    msg_type = (msg[1] >> 4) & 0x0F
-                    compression_type = msg[2] & 0x0F
-                    
-                    if msg_type == 0xB: # 音频响应
-                        # 格式: Header(4) + Seq(4) + Size(4) + Audio
-                        if len(msg) < 12: continue
-                        
-                        seq = int.from_bytes(msg[4:8], 'big', signed=True)
-                        payload_size = int.from_bytes(msg[8:12], 'big')
-                        
-                        if len(msg) < 12 + payload_size: continue
-                        audio_data = msg[12 : 12 + payload_size]
-                        
-                        if compression_type == 0x1: # Gzip
-                            audio_data = gzip.decompress(audio_data)
-                        
-                        if audio_data:
-                            yield audio_data
-                            
-                        if seq < 0: # 流结束
-                            break
-                            
-                    elif msg_type == 0xF: # 错误响应
-                        error_size = int.from_bytes(msg[8:12], 'big')
-                        error_data = msg[12 : 12 + error_size]
-                        if compression_type == 0x1:
-                            error_data = gzip.decompress(error_data)
-                        logger.error(f"TTS 服务端错误: {error_data.decode('utf-8', errors='ignore')}")
+            ws = await self._acquire()
+        except Exception as e:
+            logger.error(f"TTS 连接异常: {e}")
+            return
+
+        finished = False
+        loop = asyncio.get_running_loop()
+        try:
+            header = b'\x11\x10\x11\x00' # Gzip
+            # orjson 直接产出 bytes，免中间 str + 编码
+            payload_bytes = gzip.compress(orjson.dumps(payload))
+            payload_size = len(payload_bytes).to_bytes(4, 'big')
+
+            await ws.send(header + payload_size + payload_bytes)
+
+            while True:
+                msg = await ws.recv()
+                if len(msg) < 4: continue
+
+                msg_type = (msg[1] >> 4) & 0x0F
+                compression_type = msg[2] & 0x0F
+
+                if msg_type == 0xB: # 音频响应
+                    # 格式: Header(4) + Seq(4) + Size(4) + Audio
+                    if len(msg) < 12: continue
+
+                    seq, payload_size = _FRAME_HDR.unpack_from(msg, 4)
+
+                    if len(msg) < 12 + payload_size: continue
+                    # memoryview 切片零拷贝，解压器直接读缓冲
+                    audio_data = memoryview(msg)[12 : 12 + payload_size]
+
+                    if compression_type == 0x1: # Gzip
+                        audio_data = await loop.run_in_executor(_inflate_pool, _gunzip, audio_data)
+
+                    if audio_data:
+                        yield audio_data
+
+                    if seq < 0: # 流结束
+                        finished = True
                         break
-                        
+
+                elif msg_type == 0xF: # 错误响应
+                    if len(msg) < 12: continue
+                    _, error_size = _FRAME_HDR.unpack_from(msg, 4)
+                    error_data = msg[12 : 12 + error_size]
+                    if compression_type == 0x1:
+                        error_data = zlib.decompress(error_data, 31)
+                    logger.error(f"TTS 服务端错误: {error_data.decode('utf-8', errors='ignore')}")
+                    break
+
         except Exception as e:
-            logger.error(f"TTS 连接异常: {e}")
\ No newline at end of file
+            logger.error(f"TTS 连接异常: {e}")
+        finally:
+            # 正常跑完且连接仍活着 -> 归还池子；否则关闭
+            if finished and ws.close_code is None:
+                self._idle.append(ws)
+            else:
+                try: await ws.close()
+                except: pass
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import logging
+import httpx
+from fastapi import APIRouter
+from core.config import config_manager
+
+router = APIRouter(prefix="/api/config")
+
+logger = logging.getLogger("backend.config")
+
+# 模块级共享客户端：连接池 + keep-alive 复用，由 main.py 在 startup/shutdown 时管理。
+# 每次请求临时 new 一个 AsyncClient 会重复付出 DNS 解析、TLS 握手和连接池建/拆的代价。
+_client = None
+
+
+async def startup():
+    global _client
+    _client = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=32),
+    )
+
+
+async def shutdown():
+    global _client
+    if _client:
+        await _client.aclose()
+        _client = None
+
+
+# 探测目标 (URL + 认证头) 基本不变，首次访问后缓存，
+# 免去每次探测重复的 getenv / rstrip / f-string / dict 构造。
+# POST /api/config 可能改掉 Base URL / API Key，
+# 由 ConfigManager.update_config 调 invalidate_probe_cache 失效
+_probe_cache = None
+
+
+def invalidate_probe_cache():
+    global _probe_cache
+    _probe_cache = None
+
+
+def _probe_target():
+    global _probe_cache
+    if _probe_cache is None:
+        base_url = os.getenv("SILICONFLOW_BASE_URL", "").rstrip('/')
+        api_key = os.getenv("SILICONFLOW_API_KEY", "")
+        if not base_url or not api_key:
+            _probe_cache = (None, None)
+        else:
+            _probe_cache = (f"{base_url}/models", {"Authorization": f"Bearer {api_key}"})
+    return _probe_cache
+
+
+@router.get("")
+async def get_config():
+    """
+    返回当前模型配置（各 Agent 的 model / temperature）。
+    结果由 ConfigManager 缓存，配置面板轮询不会反复重建 dict。
+    """
+    return config_manager.get_all_config()
+
+
+@router.post("")
+async def update_config(updates: dict):
+    """
+    更新 .env 配置项（如 MODEL_PLANNER / MODEL_TALKER_TEMP）。
+    写入是原子的，且立即对后续 LLM 调用生效。
+    """
+    config_manager.update_config(updates)
+    return config_manager.get_all_config()
+
+
+@router.get("/test")
+async def test_connection():
+    """
+    探测 LLM 服务端点连通性 (GET {base_url}/models)。
+    前端配置面板用它验证 API Key / Base URL 是否可用。
+    """
+    url, auth_headers = _probe_target()
+    if url is None:
+        return {"ok": False, "error": "SILICONFLOW_BASE_URL / SILICONFLOW_API_KEY 未配置"}
+
+    try:
+        response = await _client.get(url, headers=auth_headers)
+        model_count = None
+        # 切片比较：厂商 content-type 可能带一长串参数，没必要整串扫描
+        if response.headers.get("content-type", "")[:16] == "application/json":
+            model_count = len(response.json().get("data", []))
+        return {
+            "ok": response.status_code == 200,
+            "status": response.status_code,
+            "models": model_count
+        }
+    except Exception as e:
+        logger.error(f"连通性探测失败: {e}")
+        return {"ok": False, "error": str(e)}
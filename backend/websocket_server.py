@@ -2,10 +2,11 @@ import asyncio
 import logging
 import json
 import time
-import re
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState
 from core.workflow import create_workflow
+from core.queues import ClosableQueue, QueueShutDown
+from core.agents.prefetch import maybe_prefetch_weather
 from audio.asr import DoubaoASR
 from audio.tts import DoubaoTTS
 from langchain_core.messages import HumanMessage, AIMessage
@@ -19,167 +20,233 @@ logging.basicConfig(
 )
 logger = logging.getLogger("backend.ws")
 
+# 标点扫描表：强标点映射为 \x01，弱标点映射为 \x02，其余字符原样。
+# str.translate + find 都是 C 级单遍扫描，比 re.search 更快也免去属性查找
+_PUNC_TABLE = {ord(c): '\x01' for c in '。！？!?\n'}
+_PUNC_TABLE.update({ord(c): '\x02' for c in '，,;；'})
+
+
+def _strong_split_end(text: str) -> int:
+    """第一个强标点（句号/问号/感叹号/换行）之后的切分位置；没有则返回 -1"""
+    i = text.translate(_PUNC_TABLE).find('\x01')
+    return i + 1 if i >= 0 else -1
+
+
+def _weak_split_end(text: str) -> int:
+    """第一个弱标点（逗号/分号）之后的切分位置；没有则返回 -1"""
+    i = text.translate(_PUNC_TABLE).find('\x02')
+    return i + 1 if i >= 0 else -1
+
+# --- 文本流式合批 ---
+class StreamTextBatcher:
+    """
+    把逐 token 的 chat_agent_stream 推送合并为约 30ms 一批发送。
+    每个 token 单独 send_json 要付一次 JSON 编码 + 帧头 + TCP 写；
+    前端本来就是追加语义，合批后协议不变，只是每帧携带多个 token。
+    """
+    def __init__(self, websocket: WebSocket, interval: float = 0.03):
+        self.websocket = websocket
+        self.interval = interval
+        self._parts = []
+        self._flush_task = None
+
+    def feed(self, token: str):
+        self._parts.append(token)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self._flush()
+        self._flush_task = None
+
+    async def _flush(self):
+        if self._parts:
+            text = ''.join(self._parts)
+            self._parts.clear()
+            if self.websocket.client_state == WebSocketState.CONNECTED:
+                await self.websocket.send_json({"type": "chat_agent_stream", "text": text})
+
+    async def aclose(self):
+        """取消定时器并冲刷残余 token"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try: await self._flush_task
+            except asyncio.CancelledError: pass
+        self._flush_task = None
+        await self._flush()
+
+
 # --- TTS 流式 ---
 class StreamTTSHandler:
     def __init__(self, tts_worker: DoubaoTTS, websocket: WebSocket):
         self.tts_worker = tts_worker
         self.websocket = websocket
         
-        self.text_queue = asyncio.Queue()
-        self.audio_stream_queue = asyncio.Queue()
-        
-        self.buffer = ""
-        self.processor_task = None
-        self.sender_task = None
-        # 追踪后台预取任务，以便打断时清理
-        self.prefetch_tasks = set()
-        
-        self.is_first_chunk = True 
-        
-        # 强标点：句号、问号、感叹号 (用于首句切分)
-        self.sentence_pattern = re.compile(r'[。！？!?\n]')
-        # 弱标点：逗号、分号 (用于后续切分)
-        self.comma_pattern = re.compile(r'[，,;；]')
+        self.text_queue = ClosableQueue()
+        # 顺序闸门：每个分段一个 done 事件，后一段必须等前一段发完才上行。
+        # 合成照常并行预取，闸门没开时音频块先本地暂存——省掉 "合成任务 ->
+        # 队列 -> 发送循环" 每块一次入队 + 出队 + 协程切换的中转
+        self._last_done = None
+        # 最多 3 段并行合成：重叠上游合成延迟，又不无限打开连接
+        self._tts_sem = asyncio.Semaphore(3)
+
+        # 累积缓冲用 片段列表 + 长度计数：str += 每次都是 O(n) 重分配，
+        # 一整段回复 token-by-token 累下来就是 O(n²)；只在切分时 join 一次
+        self.buffer_parts = []
+        self._buf_len = 0
+        # 结构化并发：文本处理、音频发送和所有 TTS 预取任务都挂在同一个
+        # TaskGroup 下，取消/收尾由组统一传播，省掉手工 set + done_callback 记账
+        self._tg = None
+
+        self.is_first_chunk = True
 
     async def start(self):
-        self.processor_task = asyncio.create_task(self._text_processing_loop())
-        self.sender_task = asyncio.create_task(self._audio_sending_loop())
+        self._tg = asyncio.TaskGroup()
+        await self._tg.__aenter__()
+        self._tg.create_task(self._text_processing_loop())
 
     async def feed_token(self, token: str):
         await self.text_queue.put(token)
 
     async def stop(self):
-        """正常结束：等待所有缓冲播放完毕"""
-        await self.text_queue.put(None)
-        if self.processor_task: await self.processor_task
-        if self.sender_task: await self.sender_task
+        """正常结束：等待所有缓冲播放完毕（组退出会等齐所有预取任务）"""
+        self.text_queue.shutdown()
+        if self._tg is not None:
+            await self._tg.__aexit__(None, None, None)
+            self._tg = None
 
     async def cancel(self):
-        """暴力打断：立即取消所有后台任务"""
-        # 1. 停止主循环
-        if self.processor_task and not self.processor_task.done():
-            self.processor_task.cancel()
-        if self.sender_task and not self.sender_task.done():
-            self.sender_task.cancel()
-            
-        # 2. 停止所有正在进行的 TTS 预取任务
-        for task in list(self.prefetch_tasks):
-            if not task.done():
-                task.cancel()
-        self.prefetch_tasks.clear()
+        """暴力打断：向整组任务传播取消并等待清场"""
+        if self._tg is not None:
+            try:
+                await self._tg.__aexit__(asyncio.CancelledError, asyncio.CancelledError(), None)
+            except BaseException:
+                # __aexit__ 会把传入的 CancelledError (或子任务异常组) 重新抛出
+                pass
+            self._tg = None
 
-        # 3. 清空队列
-        while not self.text_queue.empty(): self.text_queue.get_nowait()
-        while not self.audio_stream_queue.empty(): self.audio_stream_queue.get_nowait()
+        # 清空残留队列
+        self.text_queue.shutdown(immediate=True)
 
     async def _text_processing_loop(self):
         try:
             while True:
-                token = await self.text_queue.get()
-                
-                if token is None:
-                    if self.buffer.strip():
-                        await self._trigger_tts_prefetch(self.buffer)
-                    await self.audio_stream_queue.put(None)
+                try:
+                    token = await self.text_queue.get()
+                except QueueShutDown:
+                    tail = ''.join(self.buffer_parts)
+                    if tail.strip():
+                        await self._trigger_tts_prefetch(tail)
                     break
-                
-                self.buffer += token
-                
+
+                base_len = self._buf_len
+                self.buffer_parts.append(token)
+                self._buf_len += len(token)
+
                 should_split = False
                 split_idx = -1
-                
+
+                # 强标点只可能出现在新来的 token 里（旧区域早已扫过）
+                strong_end = _strong_split_end(token)
+
                 # --- 防爆音 ---
                 if self.is_first_chunk:
                     # 策略：首句必须遇到【强标点】才切分。
                     # 哪怕 "你好！" 很短，因为有感叹号，TTS 引擎知道这是句尾，会处理好衰减。
                     # 如果是 "你好，我是..."，在 "好" 后面切分会导致 "好" 的尾音被截断或产生杂音。
                     # 所以首句绝对不通过逗号切分，必须等句号/问号/感叹号。
-                    match = self.sentence_pattern.search(self.buffer)
-                    if match:
-                        split_idx = match.end()
+                    if strong_end >= 0:
+                        split_idx = base_len + strong_end
                         should_split = True
                     # 只有当缓冲区积压太长（超过 50 字）还没遇到强标点时，才被迫用逗号切分
-                    # 这是为了防止首字延迟过大
-                    elif len(self.buffer) > 50:
-                        c_match = self.comma_pattern.search(self.buffer)
-                        if c_match:
-                            split_idx = c_match.end()
-                            should_split = True
-                        else:
-                            # 实在连逗号都没有，才强行切分
-                            split_idx = len(self.buffer)
-                            should_split = True
+                    # 这是为了防止首字延迟过大 (该分支必切分，最多执行一次，join 无妨)
+                    elif self._buf_len > 50:
+                        buf = ''.join(self.buffer_parts)
+                        w = _weak_split_end(buf)
+                        # 实在连逗号都没有，才强行切分
+                        split_idx = w if w >= 0 else len(buf)
+                        should_split = True
                 else:
                     # 后续句子可以放宽，允许逗号切分，保证流式体验
-                    match = self.sentence_pattern.search(self.buffer)
-                    if match:
-                        split_idx = match.end()
+                    if strong_end >= 0:
+                        split_idx = base_len + strong_end
+                        should_split = True
+                    elif self._buf_len > 20: # 后续句子阈值可以低一点
+                        buf = ''.join(self.buffer_parts)
+                        w = _weak_split_end(buf)
+                        split_idx = w if w >= 0 else len(buf)
                         should_split = True
-                    elif len(self.buffer) > 20: # 后续句子阈值可以低一点
-                        c_match = self.comma_pattern.search(self.buffer)
-                        if c_match:
-                            split_idx = c_match.end()
-                            should_split = True
-                        else:
-                            split_idx = len(self.buffer)
-                            should_split = True
 
                 if should_split:
-                    text_segment = self.buffer[:split_idx]
-                    self.buffer = self.buffer[split_idx:]
-                    if text_segment.strip():
-                        await self._trigger_tts_prefetch(text_segment)
-                        self.is_first_chunk = False
+                    buf = ''.join(self.buffer_parts)
+                    # 一个 token 可能携带多个切分点，循环吐完
+                    while True:
+                        text_segment = buf[:split_idx]
+                        buf = buf[split_idx:]
+                        if text_segment.strip():
+                            await self._trigger_tts_prefetch(text_segment)
+                            self.is_first_chunk = False
+                        s = _strong_split_end(buf)
+                        if s >= 0:
+                            split_idx = s
+                            continue
+                        break
+                    self.buffer_parts = [buf] if buf else []
+                    self._buf_len = len(buf)
         except asyncio.CancelledError:
             pass # 允许被取消
 
     async def _trigger_tts_prefetch(self, text):
-        segment_data_queue = asyncio.Queue()
-        await self.audio_stream_queue.put(segment_data_queue)
-        
-        # 创建任务并追踪
-        task = asyncio.create_task(self._fetch_tts_data(text, segment_data_queue))
-        self.prefetch_tasks.add(task)
-        task.add_done_callback(self.prefetch_tasks.discard)
+        # 闸门链：本段的 done 事件是下一段的放行条件
+        prev_done = self._last_done
+        my_done = asyncio.Event()
+        self._last_done = my_done
+        # 预取任务挂进组里，打断时随组一起被取消
+        self._tg.create_task(self._fetch_tts_data(text, prev_done, my_done))
 
-    async def _fetch_tts_data(self, text, data_queue):
+    async def _fetch_tts_data(self, text, prev_done, my_done):
+        backlog = []  # 闸门未开时先本地暂存的音频块
         try:
-            async for chunk in self.tts_worker.synthesize_stream(text):
-                await data_queue.put(chunk)
+            async with self._tts_sem:
+                gate_open = prev_done is None or prev_done.is_set()
+                async for chunk in self.tts_worker.synthesize_stream(text):
+                    if not gate_open:
+                        if prev_done.is_set():
+                            gate_open = True
+                            for c in backlog:
+                                await self._send_audio(c)
+                            backlog.clear()
+                        else:
+                            backlog.append(chunk)
+                            continue
+                    await self._send_audio(chunk)
+                # 合成已结束但前一段还没发完：等闸门开再冲刷暂存
+                if not gate_open:
+                    await prev_done.wait()
+                    for c in backlog:
+                        await self._send_audio(c)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"TTS Gen Error: {e}")
         finally:
-            await data_queue.put(None)
+            # 无论成败都放行后续分段（取消时整组都在退出，set 无副作用）
+            my_done.set()
 
-    async def _audio_sending_loop(self):
-        try:
-            while True:
-                segment_queue = await self.audio_stream_queue.get()
-                if segment_queue is None: break 
-                
-                while True:
-                    chunk = await segment_queue.get()
-                    if chunk is None: break
-                    
-                    if self.websocket.client_state == WebSocketState.CONNECTED:
-                        await self.websocket.send_bytes(chunk)
-                    else:
-                        return
-        except asyncio.CancelledError:
-            pass
+    async def _send_audio(self, chunk):
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            await self.websocket.send_bytes(chunk)
 
 
-async def consume_and_stream_asr(websocket: WebSocket, asr_worker: DoubaoASR, audio_queue: asyncio.Queue):
-    """ASR 后台任务"""
+async def consume_and_stream_asr(websocket: WebSocket, asr_worker: DoubaoASR, audio_queue: ClosableQueue):
+    """ASR 后台任务。音频队列直接交给 ASR 发送循环消费，不再套一层生成器。"""
     final_text = ""
-    async def audio_gen():
-        while True:
-            chunk = await audio_queue.get()
-            if chunk is None: break
-            yield chunk
-
     try:
-        async for text in asr_worker.recognize_stream(audio_gen()):
+        async for text in asr_worker.recognize_stream(audio_queue):
+            # 豆包约 20Hz 吐累计文本，常常连续几次原样重复——没变化就不推
+            if text == final_text:
+                continue
             final_text = text
             await websocket.send_json({"type": "chat_user_temp", "text": final_text})
     except Exception as e:
@@ -234,14 +301,14 @@ async def websocket_endpoint(websocket: WebSocket):
                     await cancel_current_agent()
                     
                     is_recording = True
-                    audio_queue = asyncio.Queue()
+                    audio_queue = ClosableQueue()
                     asr_task = asyncio.create_task(consume_and_stream_asr(websocket, asr_worker, audio_queue))
                     logger.info("Recording Started.")
                         
                 elif cmd == "stop_recording":
                     if is_recording and audio_queue:
                         is_recording = False
-                        await audio_queue.put(None)
+                        audio_queue.shutdown()
                         await websocket.send_json({"type": "status", "state": "recognizing"})
                         
                         user_text = ""
@@ -280,9 +347,10 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e: logger.error(f"WS Error: {e}")
     finally:
         # 清理所有任务
-        if audio_queue: await audio_queue.put(None)
+        if audio_queue: audio_queue.shutdown()
         if asr_task: asr_task.cancel()
         await cancel_current_agent()
+        await tts_worker.aclose() # 归还池中的 TTS 连接
         try: await websocket.close()
         except: pass
 
@@ -291,14 +359,18 @@ async def run_agent_cycle_v2(websocket, agent_app, tts_worker, user_text):
     Agent 主循环。现在可以被 cancel_current_agent() 随时取消。
     """
     await websocket.send_json({"type": "status", "state": "thinking"})
-    
+
+    # 话里已带城市+天气/行程意图时，天气查询与 Planner 思考并行起飞
+    maybe_prefetch_weather(user_text)
+
     start_time = time.perf_counter()
     first_token_received = False
     thread_id = "demo_session"
     
     tts_handler = StreamTTSHandler(tts_worker, websocket)
     await tts_handler.start()
-    
+    text_batcher = StreamTextBatcher(websocket)
+
     try:
         async for event in agent_app.astream_events(
             {"messages": [HumanMessage(content=user_text)]},
@@ -323,7 +395,7 @@ async def run_agent_cycle_v2(websocket, agent_app, tts_worker, user_text):
                         await websocket.send_json({"type": "status", "state": "speaking"})
                         first_token_received = True
                     
-                    await websocket.send_json({"type": "chat_agent_stream", "text": token})
+                    text_batcher.feed(token)
                     await tts_handler.feed_token(token)
 
             elif event_type == "on_tool_start":
@@ -346,12 +418,14 @@ async def run_agent_cycle_v2(websocket, agent_app, tts_worker, user_text):
                     })
         
         # 正常结束
+        await text_batcher.aclose()
         await tts_handler.stop()
         await websocket.send_json({"type": "status", "state": "idle"})
 
     except asyncio.CancelledError:
         # [关键] 任务被取消时的处理逻辑
         logger.info("Agent 任务被中断")
+        await text_batcher.aclose()
         await tts_handler.cancel() # 立即停止 TTS 发送
         await websocket.send_json({"type": "status", "state": "idle"})
         raise # 重新抛出，让 asyncio 知道任务已取消
@@ -361,5 +435,6 @@ async def run_agent_cycle_v2(websocket, agent_app, tts_worker, user_text):
         if not first_token_received:
              await websocket.send_json({"type": "chat_agent_start", "latency": "Error"})
              await websocket.send_json({"type": "chat_agent_stream", "text": "系统处理出错。"})
+        await text_batcher.aclose()
         await tts_handler.cancel()
         await websocket.send_json({"type": "status", "state": "idle"})
\ No newline at end of file
@@ -1,66 +1,114 @@
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from core.llm import get_llm
 from core.state import AgentState
 from core.agents.weather import ask_weather
 from core.agents.schedule import ask_schedule
-import os
 
 # 导出工具列表供 Workflow 使用
 PLANNER_TOOLS = [ask_weather, ask_schedule]
 
-def filter_recent_messages(messages, turns=5):
+# System Prompt 固定为模块级常量：字节序列稳定（连空白都不变），
+# OpenAI 兼容服务端的自动前缀缓存才能跨请求复用这段 prefill；
+# 动态内容 (recent_messages) 严格排在静态前缀之后。
+PLANNER_SYSTEM_PROMPT = """
+    你是 VoiceAgent 的核心规划师 (Planner)。
+    你的职责是根据用户需求，调度工具 (ask_weather, ask_schedule) 并生成逻辑清晰、信息准确的回复。
+
+    ## 输出
+    - 保证内容的准确性和完整性。
+
+    ## 核心能力
+    - 意图识别：
+        - 查天气：提取地点日期 -> ask_weather -> 返回结果。
+        - 做规划：提取地点日期 -> ask_weather (必须先做) -> 拿到天气 -> ask_schedule -> 汇总建议。
+
+    ## 决策原则
+    - 必须串行：先查天气，根据天气结果再查行程。禁止盲目并发。
+    - 参数透传：调用 ask_schedule 时，weather_info 必须填入真实的 ask_weather 返回值。
+    - 拒绝废话：需要调工具时，直接输出 Tool Call，不要说 "好的我去查"。
+
+    ## 异常处理
+    - 如果工具返回错误（如无法获取天气），请诚实地告诉用户，并尝试给出通用建议。
+    """
+
+# 上下文 token 预算：prefill 计算量和 TTFT 都与输入 token 数成正比，
+# 按预算截断比按轮数截断更能保证延迟可预测
+PLANNER_CTX_BUDGET = 3072
+# 单条工具输出超过此估算值则截断，避免陈旧的工具结果霸占上下文
+TOOL_MSG_TOKEN_LIMIT = 512
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 字/token，其他按 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ch >= '⺀')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def filter_recent_messages(messages, budget=PLANNER_CTX_BUDGET):
+    """
+    按 token 预算保留最近的上下文作为短期记忆（而非固定保留 5 轮：
+    一条超长的工具输出就可能把 prompt 撑爆）。
     """
-    保留最近 N 轮对话作为短期记忆。
+    start = 0
+    total = 0
+    for i in range(len(messages) - 1, -1, -1):
+        total += _estimate_tokens(messages[i].content or "")
+        if total > budget:
+            start = i + 1
+            break
+
+    # 窗口必须从一条 human 消息开始，否则会出现没有对应
+    # tool_call 的孤立 ToolMessage，OpenAI 接口会直接报错
+    while start < len(messages) and messages[start].type != "human":
+        start += 1
+    if start >= len(messages):
+        # 预算连最后一轮都装不下，退化为只保留最后一条 human 起的内容
+        start = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].type == "human":
+                start = i
+                break
+
+    recent = messages[start:]
+
+    # 过长的工具输出用摘要占位，保留头部信息即可
+    filtered = []
+    for m in recent:
+        if m.type == "tool" and _estimate_tokens(m.content) > TOOL_MSG_TOKEN_LIMIT:
+            filtered.append(m.model_copy(
+                update={"content": f"{m.content[:200]}…（工具输出过长，已截断）"}))
+        else:
+            filtered.append(m)
+    return filtered
+
+# Prompt 模板对象图在模块导入时构建一次
+_PLANNER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", PLANNER_SYSTEM_PROMPT),
+    MessagesPlaceholder(variable_name="recent_messages"),
+])
+
+
+@lru_cache(maxsize=1)
+def _planner_chain():
     """
-    human_indices = [i for i, m in enumerate(messages) if m.type == "human"]
-    if len(human_indices) <= turns:
-        return messages
-    start_index = human_indices[-turns]
-    return messages[start_index:]
-
-def planner_node(state: AgentState):
-    # 使用 Planner 专用模型配置
-    model_name = os.getenv("MODEL_PLANNER", "Qwen/Qwen2.5-32B-Instruct")
-    temp = float(os.getenv("MODEL_PLANNER_TEMP", 0.1))
-    
-    llm = get_llm(model_name=model_name, temperature=temp)
-    
-    # 绑定工具
-    llm_with_tools = llm.bind_tools(PLANNER_TOOLS)
-    
-    # System Prompt
-    system_prompt = """
-        你是 VoiceAgent 的核心规划师 (Planner)。  
-        你的职责是根据用户需求，调度工具 (ask_weather, ask_schedule) 并生成逻辑清晰、信息准确的回复。  
-
-        ## 输出
-        - 保证内容的准确性和完整性。  
-
-        ## 核心能力
-        - 意图识别：  
-            - 查天气：提取地点日期 -> ask_weather -> 返回结果。  
-            - 做规划：提取地点日期 -> ask_weather (必须先做) -> 拿到天气 -> ask_schedule -> 汇总建议。  
-
-        ## 决策原则
-        - 必须串行：先查天气，根据天气结果再查行程。禁止盲目并发。  
-        - 参数透传：调用 ask_schedule 时，weather_info 必须填入真实的 ask_weather 返回值。  
-        - 拒绝废话：需要调工具时，直接输出 Tool Call，不要说 "好的我去查"。  
-
-        ## 异常处理
-        - 如果工具返回错误（如无法获取天气），请诚实地告诉用户，并尝试给出通用建议。
-        """
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="recent_messages"),
-    ])
-    
-    chain = prompt | llm_with_tools
-    
-    recent_messages = filter_recent_messages(state["messages"], turns=5)
-    
-    response = chain.invoke({
+    组装好的 prompt | llm(bind_tools) 链只构建一次：工具绑定要做一轮
+    Pydantic schema 转换，不必每个请求重复付。配置变更时由
+    ConfigManager.invalidate_llm_cache() 清空重建。
+    """
+    # 使用 Planner 专用模型配置（走 ConfigManager 缓存）
+    llm = get_llm(agent_name="planner")
+    return _PLANNER_PROMPT | llm.bind_tools(PLANNER_TOOLS)
+
+
+async def planner_node(state: AgentState):
+    recent_messages = filter_recent_messages(state["messages"])
+
+    # 异步调用：LLM 往返期间让出事件循环，多个 WebSocket 会话可并发推进
+    response = await _planner_chain().ainvoke({
         "recent_messages": recent_messages
     })
-    
+
     return {"messages": [response]}
\ No newline at end of file
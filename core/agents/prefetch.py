@@ -0,0 +1,44 @@
+import re
+import asyncio
+import logging
+
+logger = logging.getLogger("core.prefetch")
+
+# 常见城市清单。检测不求全（漏判只是不预取，没有代价），
+# 求的是高置信：误预取会白付一次天气 API 往返
+_CITIES = (
+    "北京", "上海", "广州", "深圳", "南京", "杭州", "苏州", "成都",
+    "重庆", "武汉", "西安", "天津", "长沙", "郑州", "青岛", "厦门",
+    "昆明", "大连", "沈阳", "哈尔滨", "三亚", "桂林", "拉萨", "乌鲁木齐",
+)
+_CITY_RE = re.compile("|".join(_CITIES))
+_INTENT_RE = re.compile(r'天气|下雨|温度|气温|规划|行程|攻略|玩')
+
+
+def maybe_prefetch_weather(user_text: str):
+    """
+    投机预取：用户话里若已带城市 + 天气/行程意图，在 Planner 开始
+    思考之前就并行发起天气查询。Planner 随后真调 ask_weather 时，
+    fetch_city_weather 会直接搭上这趟已经在飞的请求；Planner 没调，
+    结果也只是进了当天缓存，没有副作用。
+    命中时把一整次天气往返从关键路径上挪走。
+    """
+    if not _INTENT_RE.search(user_text):
+        return
+    match = _CITY_RE.search(user_text)
+    if not match:
+        return
+
+    city = match.group(0)
+    # 延迟导入：避免 prefetch <-> weather 在模块加载期互相依赖
+    from core.agents.weather import fetch_city_weather
+
+    async def _prefetch():
+        try:
+            await fetch_city_weather(city)
+        except Exception as e:
+            # 预取失败无需上抛，正式查询会自己重试
+            logger.warning(f"天气预取失败 ({city}): {e}")
+
+    asyncio.create_task(_prefetch())
+    logger.info(f"投机预取天气: {city}")
@@ -1,11 +1,50 @@
+from functools import lru_cache
 from langchain_core.tools import tool
 from langchain_core.prompts import ChatPromptTemplate
 from core.llm import get_llm
+from core.cache import schedule_cache
 from typing import Optional
-import os
+import re
+
+# 天气语义分桶：只保留天气现象词 + 5℃ 温度档。
+# "多云 24℃" 和 "多云 26℃" 对行程规划没有区别，分桶后可以命中同一条缓存
+_WEATHER_WORD_RE = re.compile(r'晴|多云|阴|小雨|中雨|大雨|暴雨|雨|小雪|大雪|雪|雾|霾|风')
+_NUM_RE = re.compile(r'-?\d+')
+
+
+def _weather_bucket(weather_info: str) -> str:
+    words = _WEATHER_WORD_RE.findall(weather_info)
+    temps = [str(int(n) // 5 * 5) for n in _NUM_RE.findall(weather_info)[:2]]
+    return ",".join(words) + "|" + ",".join(temps)
+
+
+@lru_cache(maxsize=1)
+def _schedule_chain():
+    """组装好的链只构建一次；配置变更时由 ConfigManager.invalidate_llm_cache() 清空"""
+    # 优化1：稍微降低温度（ConfigManager 默认 0.5），提高生成确定性和速度
+    # 优化3：限制生成长度并设置停止串。大纲式输出 180 token 足够；
+    # "晚上：" 段落结束（空行）即停，服务端提前终止解码，省掉尾部啰嗦
+    llm = get_llm(agent_name="schedule", max_tokens=180).bind(stop=["\n\n"])
+    # 优化2：精简 Prompt，要求“大纲式”输出，减少 Token 数量，从而减少生成时间
+    return ChatPromptTemplate.from_template(SCHEDULE_PROMPT_TEMPLATE) | llm
+
+# 模板常量：静态指令在前、变量一律排在尾部。
+# 字节稳定的静态前缀让服务端自动前缀缓存能跨请求复用这段 prefill
+SCHEDULE_PROMPT_TEMPLATE = """
+    你是行程规划专家。根据条件设计简要行程。
+
+    要求：
+    1. 必须根据天气调整（雨天室内，晴天室外）。
+    2. 仅列出 3-4 个核心景点，不要长篇大论。
+    3. 输出格式极其简洁，例如："上午：xxx；下午：xxx；晚上：xxx"。
+    4. 不要任何开场白和结束语，直接给方案。
+
+    输入：
+    - 地点: {location}, 时间: {date}, 天气: {weather_info}, 偏好: {preferences}
+    """
 
 @tool
-def ask_schedule(location: str, date: str, weather_info: str, preferences: str = "") -> str:
+async def ask_schedule(location: str, date: str, weather_info: str, preferences: str = "") -> str:
     """
     咨询行程专家。
     """
@@ -15,30 +54,16 @@ def ask_schedule(location: str, date: str, weather_info: str, preferences: str =
     if not weather_info: missing.append("天气")
     if missing: return f"缺失信息：{', '.join(missing)}"
 
-    # 优化1：稍微降低温度，提高生成确定性和速度
-    temp = float(os.getenv("MODEL_SCHEDULE_TEMP", 0.5)) 
-    llm = get_llm(temperature=temp)
-    
-    # 优化2：精简 Prompt，要求“大纲式”输出，减少 Token 数量，从而减少生成时间
-    system_prompt = """
-    你是行程规划专家。根据条件设计简要行程。
-    
-    输入：
-    - 地点: {location}, 时间: {date}, 天气: {weather_info}, 偏好: {preferences}
-    
-    要求：
-    1. 必须根据天气调整（雨天室内，晴天室外）。
-    2. 仅列出 3-4 个核心景点，不要长篇大论。
-    3. 输出格式极其简洁，例如："上午：xxx；下午：xxx；晚上：xxx"。
-    4. 不要任何开场白和结束语，直接给方案。
-    """
-    
-    prompt = ChatPromptTemplate.from_template(system_prompt)
-    chain = prompt | llm
-    
-    # 这一步是同步阻塞的，生成的字越少，阻塞时间越短
-    response = chain.invoke({
+    # 优化4：响应缓存。同一 (地点, 日期, 天气档, 偏好) 的重复请求直接复用上次结果
+    cache_key = f"{location}|{date}|{_weather_bucket(weather_info)}|{preferences}"
+    cached = schedule_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 异步调用，生成的字越少，等待时间越短；ask_weather 已是 async，工具层保持一致
+    response = await _schedule_chain().ainvoke({
         "location": location, "date": date, "weather_info": weather_info, "preferences": preferences
     })
-    
+
+    schedule_cache.set(cache_key, response.content)
     return response.content
\ No newline at end of file
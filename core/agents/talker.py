@@ -1,59 +1,85 @@
-import os
+import re
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import SystemMessage, HumanMessage
 from core.llm import get_llm
 from core.state import AgentState
 
-def talker_node(state: AgentState):
+# 思考痕迹过滤：think 块与前缀行合成一个交替式，整串一遍删完。
+# (?s:...) 把 DOTALL 限定在 think 块内部，避免影响行模式的 .*；
+# 前缀行连同行尾换行一起吞掉，不会留下空行
+_FILTER_RE = re.compile(
+    r'<think>(?s:.*?)</think>'
+    r'|^[ \t]*(?:Think:|思考：).*\n?',
+    re.IGNORECASE | re.MULTILINE)
+# 空行压缩必须放在删除之后 —— 删除本身会把原本隔开的空行接到一起
+_BLANK_RE = re.compile(r'\n{3,}')
+
+
+def filter_think_content(content: str) -> str:
     """
-    Talker Agent: 负责将 Planner 的逻辑输出转化为自然的口语文本 (Speech Script)。
-    专门用于 TTS (Text-to-Speech) 前的预处理。
+    过滤推理模型输出中的思考痕迹（<think> 块、Think:/思考： 前缀行），
+    避免内部推理被 Talker 复述并送进 TTS。
+    """
+    return _BLANK_RE.sub('\n\n', _FILTER_RE.sub('', content)).strip()
+
+# System Prompt 固定为模块级常量，保持字节序列稳定以命中服务端前缀缓存；
+# 动态的 {content} 严格排在静态前缀之后
+TALKER_SYSTEM_PROMPT = """
+    你是 VoiceAgent 的语音合成润色师。
+
+    ## 你的任务
+    将输入的文本重写为适合语音合成的纯文本口语脚本，说得更自然有温度。
+
+    ## 转换规则
+    1. 短句优先：长难句拆分为短句，方便听众理解，压缩篇幅。
+    2. 去除格式：删除所有 Markdown 符号（如 **加粗**、# 标题、- 列表符）以及表情符号。
+    3. 情感注入：根据内容加入适当的语气词（"哇"、"好的"、"没问题"），保持亲切感。
+    4. 保持原意：绝对不要篡改 Planner 提供的核心信息（如时间、地点、天气数据）。
+
+    ## 示例
+    输入: "南京天气：多云，25℃。建议：1. 中山陵；2. 夫子庙。"
+    输出: "南京今天是多云天气，气温二十五度，非常舒适。我建议您可以先去中山陵逛逛，晚上再由夫子庙感受秦淮风光。"
     """
-    # Talker 不需要太强的逻辑，需要高情商和自然语言能力
-    temp = float(os.getenv("MODEL_TALKER_TEMP", 0.9))
 
-    llm = get_llm(temperature=temp)
 
+# Prompt 模板对象图在模块导入时构建一次
+_TALKER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", TALKER_SYSTEM_PROMPT),
+    ("human", "{content}")
+])
+
+
+@lru_cache(maxsize=1)
+def _talker_llm():
+    """缓存 LLM 实例；配置变更时由 ConfigManager.invalidate_llm_cache() 清空"""
+    # Talker 不需要太强的逻辑，需要高情商和自然语言能力。
+    # 风格改写用 7B 足矣：小模型解码速率高，直接压低 TTS 前的等待。
+    # model / temperature 统一走 ConfigManager 缓存的配置
+    return get_llm(agent_name="talker")
+
+
+async def talker_node(state: AgentState):
+    """
+    Talker Agent: 负责将 Planner 的逻辑输出转化为自然的口语文本 (Speech Script)。
+    专门用于 TTS (Text-to-Speech) 前的预处理。
+    """
     # 获取 Planner 的最后一条回复
     planner_message = state["messages"][-1]
-    original_content = planner_message.content
-
-    # system_prompt = """
-    #     你是感性有情绪的 VoiceAgent 润色师。
-
-    #     任务：把输入信息 --格式化--> 适合语音合成的纯文本口语稿，保留关键信息，说得更自然有温度。
-    #     3. 口语化：
-            # - 将 "1. xxx; 2. xxx" 转化为 "首先是... 其次是..." 或自然断句。
-            # - 将 "22℃" 读作 "二十二度"。
-            # - 将 "09:00" 读作 "上午九点"。
-    #     """
-    
-    system_prompt = """
-        你是 VoiceAgent 的语音合成润色师。
-        
-        ## 你的任务
-        将输入的文本重写为适合语音合成的纯文本口语脚本，说得更自然有温度。
-        
-        ## 转换规则
-        1. 短句优先：长难句拆分为短句，方便听众理解，压缩篇幅。
-        2. 去除格式：删除所有 Markdown 符号（如 **加粗**、# 标题、- 列表符）以及表情符号。
-        3. 情感注入：根据内容加入适当的语气词（"哇"、"好的"、"没问题"），保持亲切感。
-        4. 保持原意：绝对不要篡改 Planner 提供的核心信息（如时间、地点、天气数据）。
-        
-        ## 示例
-        输入: "南京天气：多云，25℃。建议：1. 中山陵；2. 夫子庙。"
-        输出: "南京今天是多云天气，气温二十五度，非常舒适。我建议您可以先去中山陵逛逛，晚上再由夫子庙感受秦淮风光。"
-        """
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "{content}")
-    ])
-
-    chain = prompt | llm
-
-    # 生成润色后的语音文本
-    response = chain.invoke({"content": original_content})
+    original_content = filter_think_content(planner_message.content)
+
+    # 润色是"改写"而非"扩写"，输出长度和输入成正比。
+    # 按输入长度估算 max_tokens 上限（中文约 1 字/token），避免模型跑题后无限发散。
+    # max_tokens 随输入变化，用 bind 挂在缓存的 LLM 实例上
+    max_tokens = min(512, len(original_content) * 2 + 64)
+
+    chain = _TALKER_PROMPT | _talker_llm().bind(max_tokens=max_tokens)
+
+    # 逐 token 流式消费而不是等整条回复：token 以 on_chat_model_stream
+    # 事件实时冒泡给 backend/websocket_server.py，那边按句切分立刻送 TTS，
+    # LLM 解码和语音合成全程重叠，用户听到首句时模型还在继续生成
+    response = None
+    async for chunk in chain.astream({"content": original_content}):
+        response = chunk if response is None else response + chunk
 
     # 我们将 Talker 的回复作为最终回复覆盖或追加
     # 在 AgentState 中，通常最好是追加一个新的 AIMessage
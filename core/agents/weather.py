@@ -1,34 +1,107 @@
 import os
+import time
+import asyncio
 from langchain_core.tools import tool
-from langgraph.prebuilt import create_react_agent
+from pydantic import BaseModel, Field
 from core.tools.bridge import MCPBridge
+from core.cache import weather_cache
 from core.llm import get_llm
 
+
+class WeatherQuery(BaseModel):
+    """从用户的天气问题中抽取的结构化参数"""
+    city: str = Field(description="要查询天气的城市名，如 '南京'、'北京'")
+
 # Path to weather server
 # 假设 weather_server.py 在项目根目录的 tools/ 文件夹下
 WEATHER_SERVER_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../tools/weather_server.py"))
 
+# 常驻 MCP Bridge 单例：weather_server 子进程随应用启动/关闭，
+# 不再为每次查询付出 spawn 子进程 + import + initialize 的冷启动开销。
+# main.py 在 startup/shutdown 事件中调用 weather_bridge.start()/stop()
+weather_bridge = MCPBridge(WEATHER_SERVER_PATH)
+
+_tools_lock = asyncio.Lock()
+_tools_cache = None
+
+
+async def get_weather_tools():
+    """返回缓存的 LangChain 工具列表（list_tools 对同一 Server 是不变的）"""
+    global _tools_cache
+    if _tools_cache is None:
+        async with _tools_lock:
+            if _tools_cache is None:
+                # 脚本/测试场景下应用可能没走 FastAPI 生命周期，兜底拉起
+                if weather_bridge.session is None:
+                    await weather_bridge.start()
+                _tools_cache = await weather_bridge.get_langchain_tools()
+    return _tools_cache
+
+# 按城市去重的进行中请求表：投机预取和 Planner 的正式查询共用同一次往返
+_city_inflight = {}
+
+
+def _is_error_reply(text: str) -> bool:
+    """weather_server 把失败以普通字符串上报（"Error: ..."、"Exception during ..."、
+    "No forecast/casts data ..."），不会抛异常。与服务端自身的 _weather_cache
+    口径一致：只缓存成功结果，瞬时故障不会被钉在缓存里，下次查询自然重试"""
+    return text.startswith(("Error", "Exception", "No "))
+
+
+async def fetch_city_weather(city: str) -> str:
+    """
+    获取指定城市的天气报告（带当天缓存与并发去重）。
+    prefetch 的投机预取和 ask_weather 的正式查询都走这里，
+    同一城市同时只有一次 MCP 往返在飞。
+    """
+    day_key = f"city:{city}|{time.strftime('%Y-%m-%d')}"
+    cached = weather_cache.get(day_key)
+    if cached is not None:
+        return cached
+
+    task = _city_inflight.get(city)
+    if task is None:
+        async def _fetch():
+            await get_weather_tools()  # 确保常驻 Bridge 已连接
+            result = await weather_bridge.session.call_tool(
+                "get_weather", arguments={"city": city})
+            return result.content[0].text
+
+        task = asyncio.create_task(_fetch())
+        _city_inflight[city] = task
+        task.add_done_callback(lambda t: _city_inflight.pop(city, None))
+
+    # shield：预取发起的任务不因某一个等待方被打断而作废
+    text = await asyncio.shield(task)
+    if not _is_error_reply(text):
+        weather_cache.set(day_key, text)
+    return text
+
+
 @tool
 async def ask_weather(query: str) -> str:
     """
     咨询气象专家。输入你想查询的天气问题（如：南京未来三天天气）。
     返回自然语言的天气总结。
     """
-    # 启动 MCP Bridge
-    async with MCPBridge(WEATHER_SERVER_PATH) as bridge:
-        # 获取 MCP 工具 (get_weather 等)
-        tools = await bridge.get_langchain_tools()
-        temp = float(os.getenv("MODEL_WEATHER_TEMP", 0.1))
-
-        llm = get_llm(temperature=temp)
-        
-        # 创建微型 ReAct Agent (Weather Expert)
-        # 这个 Agent 负责思考如何使用 MCP 工具来回答 query
-        agent = create_react_agent(llm, tools)
-        
-        # 执行 Agent
-        # 注意：这里是独立的 Agent 执行流，它的记忆是临时的 (Local Memory)
-        result = await agent.ainvoke({"messages": [("user", query)]})
-        
-        # 返回最终生成的回复 (Last message content)
-        return result["messages"][-1].content
+    # 响应缓存：同一问题当天重复提问直接复用（带日期桶，跨天自动失效）
+    cache_key = f"{query}|{time.strftime('%Y-%m-%d')}"
+    cached = weather_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 天气查询几乎总是单次 get_weather 调用，不需要完整的 ReAct 循环
+    # （"思考->行动->观察" 至少多付 1-2 次大模型往返）。
+    # 这里只用一次小型结构化抽取拿到城市名，然后直连 MCP 工具。
+    # 城市名抽取不需要 32B 推理能力，默认路由到 7B 小模型；
+    # 配置走 ConfigManager 缓存，不再每次查询 os.getenv
+    extract_llm = get_llm(agent_name="weather",
+                          streaming=False).with_structured_output(WeatherQuery)
+    parsed = await extract_llm.ainvoke(f"提取下面这个天气问题中要查询的城市：{query}")
+
+    # weather_server 返回的已经是格式化好的中文天气报告，直接交给 Planner 汇总，
+    # 无需再让 LLM 复述一遍。若预取已在飞，这里直接搭车
+    answer = await fetch_city_weather(parsed.city)
+    if not _is_error_reply(answer):
+        weather_cache.set(cache_key, answer)
+    return answer
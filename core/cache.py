@@ -0,0 +1,42 @@
+import time
+
+
+class TTLCache:
+    """
+    简易 TTL + LRU 缓存（进程内、单事件循环使用，无需加锁）。
+
+    用于缓存专家工具 (ask_weather / ask_schedule) 的 LLM 回复：
+    同一城市/日期的重复提问直接命中缓存，省掉一次完整的大模型调用
+    （秒级 -> 微秒级）。
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}  # key -> (expire_at, value)；dict 保序，兼作 LRU 队列
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            return None
+        # 命中后移到末尾，保持 LRU 淘汰顺序
+        del self._data[key]
+        self._data[key] = item
+        return value
+
+    def set(self, key, value):
+        if key in self._data:
+            del self._data[key]
+        elif len(self._data) >= self.maxsize:
+            # 淘汰最久未使用的一项（dict 首位）
+            self._data.pop(next(iter(self._data)))
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+
+# 专家回复缓存：10 分钟内重复的行程/天气咨询直接复用
+schedule_cache = TTLCache(maxsize=512, ttl=600)
+weather_cache = TTLCache(maxsize=512, ttl=600)
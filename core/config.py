@@ -0,0 +1,146 @@
+import os
+import logging
+import tempfile
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+logger = logging.getLogger("core.config")
+
+# 各 Agent 的温度默认值（与 core/agents 中各节点的取值保持一致）
+_DEFAULT_TEMPS = {
+    "planner": 0.1,
+    "talker": 0.9,
+    "schedule": 0.5,
+    "weather": 0.1,
+}
+
+# Talker / Weather 只做风格改写和参数抽取，默认路由到 7B 小模型；
+# 其余 Agent 跟随 SILICONFLOW_MODEL
+_DEFAULT_MODELS = {
+    "talker": "Qwen/Qwen2.5-7B-Instruct",
+    "weather": "Qwen/Qwen2.5-7B-Instruct",
+}
+
+
+@dataclass(frozen=True)
+class AgentConfig:
+    """单个 Agent 的模型配置。frozen：实例跨调用共享，只读安全"""
+    model: str
+    temperature: float
+
+
+class ConfigManager:
+    """
+    集中管理 .env 中的模型配置（每个 Agent 的 model / temperature）。
+
+    配置在进程内基本不变，get_all_config 的结果做缓存，
+    只有 _reload_config（配置被修改后）才失效重建 —— 配置面板
+    轮询这个接口时不再每次重建嵌套 dict。
+    """
+
+    AGENTS = ("planner", "talker", "schedule", "weather")
+
+    def __init__(self, env_path: str = None):
+        self.env_path = env_path or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+        self._agent_configs = {}
+        self._all_config_cache = None
+        self._reload_config()
+
+    def _reload_config(self, reload_env: bool = True):
+        if reload_env:
+            load_dotenv(self.env_path, override=True)
+        default_model = os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen2.5-32B-Instruct")
+
+        configs = {}
+        for name in self.AGENTS:
+            upper = name.upper()
+            configs[name] = AgentConfig(
+                model=os.getenv(f"MODEL_{upper}", _DEFAULT_MODELS.get(name, default_model)),
+                temperature=float(os.getenv(f"MODEL_{upper}_TEMP", _DEFAULT_TEMPS[name])),
+            )
+        self._agent_configs = configs
+        # 失效序列化缓存，下一次 get_all_config 时重建
+        self._all_config_cache = None
+
+    def get_agent_config(self, agent_name: str) -> AgentConfig:
+        return self._agent_configs[agent_name]
+
+    def _build_all_config(self) -> dict:
+        return {
+            "base_url": os.getenv("SILICONFLOW_BASE_URL", ""),
+            "default_model": os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen2.5-32B-Instruct"),
+            "agents": {
+                name: {"model": cfg.model, "temperature": cfg.temperature}
+                for name, cfg in self._agent_configs.items()
+            },
+        }
+
+    def get_all_config(self) -> dict:
+        if self._all_config_cache is None:
+            self._all_config_cache = self._build_all_config()
+        return self._all_config_cache
+
+    def update_config(self, updates: dict):
+        """
+        更新 .env 中的配置项并立即生效。
+
+        - 原子写：先写临时文件再 os.replace，并发读者不会看到半截文件；
+        - 不走 env 往返：写盘后直接把新值灌进 os.environ 并重建缓存，
+          不依赖重新解析 .env。
+        """
+        # 读出现有内容，保留注释与行序，就地替换被更新的键
+        lines = []
+        seen = set()
+        if os.path.exists(self.env_path):
+            with open(self.env_path, encoding="utf-8") as f:
+                for line in f:
+                    stripped = line.strip()
+                    if stripped and not stripped.startswith("#") and "=" in stripped:
+                        key = stripped.split("=", 1)[0].strip()
+                        if key in updates:
+                            line = f"{key}={updates[key]}\n"
+                            seen.add(key)
+                    lines.append(line)
+        for key, value in updates.items():
+            if key not in seen:
+                lines.append(f"{key}={value}\n")
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.env_path) or ".", prefix=".env.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.env_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        for key, value in updates.items():
+            os.environ[key] = str(value)
+        self._reload_config(reload_env=False)
+        self.invalidate_llm_cache()
+        # 连通性探测缓存的 URL/Key 可能被本次更新改掉，一并失效。
+        # 延迟导入，避免 core <-> backend 的循环依赖
+        from backend import config_api
+        config_api.invalidate_probe_cache()
+        logger.info(f"配置已更新: {', '.join(updates)}")
+
+    def invalidate_llm_cache(self):
+        """
+        配置变更后清空各 Agent 缓存的 LLM / chain，下次调用按新配置重建。
+        延迟导入，避免 config <-> agents 的循环依赖。
+        """
+        from core import llm
+        from core.agents import planner, talker, schedule
+        llm._build_llm.cache_clear()
+        planner._planner_chain.cache_clear()
+        talker._talker_llm.cache_clear()
+        schedule._schedule_chain.cache_clear()
+
+
+# 全局单例：配置面板 API 与各 Agent 共用
+config_manager = ConfigManager()
@@ -0,0 +1,144 @@
+import os
+import uuid
+import asyncio
+import logging
+import orjson
+import httpx
+
+logger = logging.getLogger("core.dispatcher")
+
+# 攒批阈值：满 10 条或等满 30 秒即提交
+_FLUSH_MAX = 10
+_FLUSH_INTERVAL = 30.0
+# 批任务轮询间隔
+_POLL_INTERVAL = 30.0
+
+
+class BatchDispatcher:
+    """
+    按延迟预算分流 LLM 请求的分发器。
+
+    - latency_budget_ms < 5000：交互路径，直接走 chat/completions 同步返回。
+    - 预算宽松（如夜间预生成次日行程、批量重写 Talker 脚本）：攒进缓冲区，
+      满批或超时后打包成 JSONL 提交 Batch API —— 吞吐更高，且批量接口
+      通常有约五折的价格折扣。
+
+    用法: answer = await dispatcher.submit(messages, latency_budget_ms=3_600_000)
+    """
+
+    def __init__(self):
+        self._pending = []  # [(request_line_dict, future)]
+        self._lock = asyncio.Lock()
+        self._flush_timer = None
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # 懒初始化：避免 import 时就要求配好环境变量
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=os.getenv("SILICONFLOW_BASE_URL", "").rstrip('/'),
+                headers={"Authorization": f"Bearer {os.getenv('SILICONFLOW_API_KEY', '')}"},
+                timeout=120.0,
+            )
+        return self._client
+
+    async def submit(self, messages: list, model: str = None, latency_budget_ms: int = 0) -> str:
+        model = model or os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen2.5-32B-Instruct")
+        body = {"model": model, "messages": messages}
+
+        if latency_budget_ms < 5000:
+            # 交互请求等不起批处理，直接同步调用
+            resp = await self._http().post("/chat/completions", json=body)
+            resp.raise_for_status()
+            return resp.json()["choices"][0]["message"]["content"]
+
+        fut = asyncio.get_running_loop().create_future()
+        line = {
+            "custom_id": uuid.uuid4().hex,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }
+        async with self._lock:
+            self._pending.append((line, fut))
+            if len(self._pending) >= _FLUSH_MAX:
+                self._start_flush()
+            elif self._flush_timer is None:
+                self._flush_timer = asyncio.create_task(self._delayed_flush())
+        return await fut
+
+    def _start_flush(self):
+        batch, self._pending = self._pending, []
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        asyncio.create_task(self._run_batch(batch))
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(_FLUSH_INTERVAL)
+        async with self._lock:
+            self._flush_timer = None
+            if self._pending:
+                self._start_flush()
+
+    async def _run_batch(self, batch):
+        futures = {line["custom_id"]: fut for line, fut in batch}
+        try:
+            client = self._http()
+
+            # 1. 上传 JSONL 请求文件
+            jsonl = b"\n".join(orjson.dumps(line) for line, _ in batch)
+            resp = await client.post(
+                "/files",
+                files={"file": ("batch.jsonl", jsonl, "application/jsonl")},
+                data={"purpose": "batch"},
+            )
+            resp.raise_for_status()
+            file_id = resp.json()["id"]
+
+            # 2. 创建批任务
+            resp = await client.post("/batches", json={
+                "input_file_id": file_id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            })
+            resp.raise_for_status()
+            batch_id = resp.json()["id"]
+            logger.info(f"批任务已提交: {batch_id} ({len(batch)} 条)")
+
+            # 3. 轮询直至完成
+            while True:
+                await asyncio.sleep(_POLL_INTERVAL)
+                resp = await client.get(f"/batches/{batch_id}")
+                resp.raise_for_status()
+                info = resp.json()
+                status = info.get("status")
+                if status == "completed":
+                    break
+                if status in ("failed", "expired", "cancelled"):
+                    raise RuntimeError(f"批任务 {batch_id} 状态异常: {status}")
+
+            # 4. 下载结果，按 custom_id 回填各自的 future
+            resp = await client.get(f"/files/{info['output_file_id']}/content")
+            resp.raise_for_status()
+            for raw in resp.content.splitlines():
+                if not raw:
+                    continue
+                result = orjson.loads(raw)
+                fut = futures.pop(result["custom_id"], None)
+                if fut is not None and not fut.done():
+                    content = result["response"]["body"]["choices"][0]["message"]["content"]
+                    fut.set_result(content)
+            # 没出现在结果文件里的请求视为失败
+            for fut in futures.values():
+                if not fut.done():
+                    fut.set_exception(RuntimeError("批任务结果中缺少该请求"))
+        except Exception as e:
+            logger.error(f"批任务执行失败: {e}")
+            for fut in futures.values():
+                if not fut.done():
+                    fut.set_exception(e)
+
+
+# 全局单例：非实时任务共享同一个攒批缓冲区
+dispatcher = BatchDispatcher()
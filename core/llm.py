@@ -1,6 +1,7 @@
 import os
 import time
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.callbacks import BaseCallbackHandler
@@ -14,44 +15,72 @@ logger = logging.getLogger("core.llm")
 class LoggingCallbackHandler(BaseCallbackHandler):
     """
     跟踪大模型延迟（首字延迟TTFT和总耗时）。
+    计时状态按 run_id 隔离：同一 handler 实例挂在缓存的 LLM 上，
+    会被并发调用共享，不能再用实例属性存开始时间。
     """
     def __init__(self, model_name):
         self.model_name = model_name
-        self.start_time = 0
-        self.first_token_time = 0
+        self._runs = {}  # run_id -> [start_time, 是否已见首 token]
 
-    def on_llm_start(self, serialized, prompts, **kwargs):
-        self.start_time = time.time()
-        self.first_token_time = 0
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._runs[run_id] = [time.time(), False]
 
-    def on_llm_new_token(self, token: str, **kwargs):
-        if self.first_token_time == 0:
-            self.first_token_time = time.time()
-            ttft = (self.first_token_time - self.start_time) * 1000
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run and not run[1]:
+            run[1] = True
+            ttft = (time.time() - run[0]) * 1000
             logger.info(f"[{self.model_name}] 首字延迟TTFT: {ttft:.2f} ms")
 
-    def on_llm_end(self, response: LLMResult, **kwargs):
-        end_time = time.time()
-        total_duration = (end_time - self.start_time) * 1000
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run:
+            total_duration = (time.time() - run[0]) * 1000
+            logger.info(f"[{self.model_name}] 生成结束，总推理时长: {total_duration:.2f} ms")
 
-        logger.info(f"[{self.model_name}] 生成结束，总推理时长: {total_duration:.2f} ms")
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        # 出错也要清掉计时记录，避免字典缓慢膨胀
+        self._runs.pop(run_id, None)
 
-def get_llm(model_name: str = None, temperature: float = 0.1, streaming: bool = True):
-    """获取配置好的 LLM 实例"""
+
+@lru_cache(maxsize=16)
+def _build_llm(model_name: str, temperature: float, streaming: bool, max_tokens):
+    """
+    按参数缓存 ChatOpenAI 实例。每次 new 都会新建底层 openai/httpx 客户端，
+    首个请求要重付 TCP+TLS 握手；复用实例才能吃到连接池 keep-alive。
+    配置变更时由 ConfigManager.invalidate_llm_cache() 清空。
+    """
     api_key = os.getenv("SILICONFLOW_API_KEY")
     base_url = os.getenv("SILICONFLOW_BASE_URL")
-    
-    target_model = model_name or os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen2.5-32B-Instruct")
 
     if not api_key:
         raise ValueError("请在 .env 中配置 SILICONFLOW_API_KEY")
 
-    llm = ChatOpenAI(
-        model=target_model,
+    return ChatOpenAI(
+        model=model_name,
         openai_api_key=api_key,
         openai_api_base=base_url,
         temperature=temperature,
         streaming=streaming,
-        callbacks=[LoggingCallbackHandler(target_model)]
+        max_tokens=max_tokens,
+        callbacks=[LoggingCallbackHandler(model_name)]
     )
-    return llm
\ No newline at end of file
+
+
+def get_llm(model_name: str = None, temperature: float = None, streaming: bool = True,
+            max_tokens: int = None, agent_name: str = None):
+    """
+    获取配置好的 LLM 实例（相同参数复用同一实例及其连接池）。
+    传 agent_name 时从 ConfigManager 的缓存配置取 model/temperature，
+    避免每次调用重复 os.getenv + float 解析。
+    """
+    if agent_name is not None:
+        from core.config import config_manager  # 延迟导入，避免循环依赖
+        cfg = config_manager.get_agent_config(agent_name)
+        model_name = model_name or cfg.model
+        if temperature is None:
+            temperature = cfg.temperature
+    if temperature is None:
+        temperature = 0.1
+    target_model = model_name or os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen2.5-32B-Instruct")
+    return _build_llm(target_model, temperature, streaming, max_tokens)
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+asyncio.Queue 关闭语义兼容层。
+
+Python 3.13 原生提供 Queue.shutdown / QueueShutDown；低版本用内部哨兵对象
+模拟同一套接口：生产端调用 shutdown() 之后，消费端的 get() 抛 QueueShutDown。
+这样热循环里就是一次裸 get()，不必每条消息都与 None 结束标记做比较。
+"""
+import asyncio
+
+try:
+    from asyncio import QueueShutDown  # Python 3.13+
+    ClosableQueue = asyncio.Queue
+except ImportError:
+    class QueueShutDown(Exception):
+        """队列已关闭，不会再有新数据"""
+
+    # 内部关闭哨兵，不会与业务数据混淆
+    _SHUTDOWN = object()
+
+    class ClosableQueue(asyncio.Queue):
+        def shutdown(self, immediate: bool = False):
+            """
+            关闭队列。immediate=True 时丢弃积压数据，消费端立即感知关闭；
+            否则已入队的数据仍会被取完，之后 get() 抛 QueueShutDown。
+            """
+            if immediate:
+                while not self.empty():
+                    super().get_nowait()
+            super().put_nowait(_SHUTDOWN)
+
+        async def get(self):
+            item = await super().get()
+            if item is _SHUTDOWN:
+                # 放回哨兵，后续 get() / 其他消费者同样能感知关闭
+                super().put_nowait(_SHUTDOWN)
+                raise QueueShutDown
+            return item
+
+        def get_nowait(self):
+            item = super().get_nowait()
+            if item is _SHUTDOWN:
+                super().put_nowait(_SHUTDOWN)
+                raise QueueShutDown
+            return item
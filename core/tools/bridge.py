@@ -5,6 +5,21 @@ from mcp.client.stdio import stdio_client
 from langchain_core.tools import tool, StructuredTool
 from pydantic import create_model
 
+# 动态生成的参数模型按 (工具名, 字段集) 缓存：create_model 要走一遍
+# 元类机制和 pydantic core-schema 编译，同一工具没必要反复生成
+_SCHEMA_CACHE = {}
+
+
+def _input_model(tool_name: str, fields: tuple):
+    key = (tool_name, fields)
+    model = _SCHEMA_CACHE.get(key)
+    if model is None:
+        # 简化处理：目前假设所有参数都是 string，生产环境需要根据 JSON Schema 严格转换
+        model = create_model(f"{tool_name}_Input", **{k: (str, ...) for k in fields})
+        _SCHEMA_CACHE[key] = model
+    return model
+
+
 class MCPBridge:
     """
     负责管理与 MCP Server 的连接，并将 MCP 工具转换为 LangChain 工具
@@ -18,21 +33,30 @@ class MCPBridge:
         self.session = None
         self.client_ctx = None
 
-    async def __aenter__(self):
-        # 建立连接上下文
+    async def start(self):
+        """建立与 MCP Server 的连接（拆出 __aenter__，供常驻单例在应用启动时调用）"""
         self.client_ctx = stdio_client(self.server_params)
         read, write = await self.client_ctx.__aenter__()
-        
+
         self.session = ClientSession(read, write)
         await self.session.__aenter__()
         await self.session.initialize()
-        return self
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
+    async def stop(self):
+        """关闭连接并回收子进程"""
         if self.session:
-            await self.session.__aexit__(exc_type, exc_val, exc_tb)
+            await self.session.__aexit__(None, None, None)
+            self.session = None
         if self.client_ctx:
-            await self.client_ctx.__aexit__(exc_type, exc_val, exc_tb)
+            await self.client_ctx.__aexit__(None, None, None)
+            self.client_ctx = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
 
     async def get_langchain_tools(self) -> List[StructuredTool]:
         """查询 MCP Server 的能力，并自动转换为 LangChain 工具"""
@@ -43,16 +67,17 @@ class MCPBridge:
         langchain_tools = []
 
         for m_tool in mcp_tools.tools:
-            # 动态创建工具函数
-            async def _dynamic_tool_func(**kwargs):
+            # 动态创建工具函数。
+            # 工具名必须用默认参数固化：闭包直接引用 m_tool 会晚绑定到
+            # 循环的最后一个工具，导致所有工具都调到同一个名字上
+            async def _dynamic_tool_func(_tool_name=m_tool.name, **kwargs):
                 # 真正的调用发生在这里
-                result = await self.session.call_tool(m_tool.name, arguments=kwargs)
+                result = await self.session.call_tool(_tool_name, arguments=kwargs)
                 return result.content[0].text
 
-            # 动态创建参数模型 (Pydantic)
-            # 简化处理：目前假设所有参数都是 string，生产环境需要根据 JSON Schema 严格转换
-            fields = {k: (str, ...) for k in m_tool.inputSchema.get("properties", {}).keys()}
-            InputModel = create_model(f"{m_tool.name}_Input", **fields)
+            # 参数模型 (Pydantic) 走模块级缓存，重复连接时不再重新编译
+            fields = tuple(sorted(m_tool.inputSchema.get("properties", {}).keys()))
+            InputModel = _input_model(m_tool.name, fields)
 
             # 封装为 LangChain Tool
             lc_tool = StructuredTool.from_function(
@@ -5,6 +5,8 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from backend.websocket_server import router as websocket_router
+from backend import config_api
+from core.agents.weather import weather_bridge
 from dotenv import load_dotenv
 
 # 3. 日志配置
@@ -30,6 +32,15 @@ app.add_middleware(
 # 注册 WebSocket 路由
 app.include_router(websocket_router)
 
+# 注册配置 API 路由，共享 HTTP 客户端随应用生命周期创建/销毁
+app.include_router(config_api.router)
+app.add_event_handler("startup", config_api.startup)
+app.add_event_handler("shutdown", config_api.shutdown)
+
+# 常驻 MCP Bridge：weather_server 子进程随应用启动，避免每次查天气冷启动
+app.add_event_handler("startup", weather_bridge.start)
+app.add_event_handler("shutdown", weather_bridge.stop)
+
 # favicon 路由（防止 404 日志）
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon_404():
@@ -45,4 +56,14 @@ app.mount("/", StaticFiles(directory=static_dir, html=True), name="static")
 if __name__ == "__main__":
     logger = logging.getLogger("main")
     logger.info("VoiceAgent 服务已启动，访问地址：http://localhost:8000")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # 热重载只在开发时开（DEV=1）：生产环境下文件监控白耗 CPU，
+    # 且 reload 与多 worker 互斥
+    dev_mode = os.getenv("DEV") == "1"
+    # uvloop + httptools 由 uvicorn[standard] 提供，I/O 密集的
+    # WebSocket / HTTP 场景下事件循环吞吐明显高于默认 asyncio。
+    # permessage-deflate: 浏览器方向的 ASR 临时转写、流式文本高度可压缩
+    uvicorn.run("main:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools",
+                reload=dev_mode,
+                workers=1 if dev_mode else int(os.getenv("WEB_CONCURRENCY", "1")),
+                ws_per_message_deflate=True)
\ No newline at end of file
@@ -1,9 +1,22 @@
 import os
+import time
+import pickle
+import socket
+import asyncio
+import functools
 import httpx
-import pandas as pd
+import orjson
+import openpyxl
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 
+# 可选依赖：Aho-Corasick 自动机把模糊匹配从 Python 级逐条扫表
+# 换成一次 C 级遍历；没装就退回线性扫
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # 加载环境变量
 load_dotenv()
 
@@ -13,138 +26,301 @@ AMAP_ADCODE_FILE = "tools/AMap_adcode_citycode.xlsx"
 # 初始化 MCP 服务
 mcp = FastMCP("WeatherService")
 
-# 加载城市编码表
-df_city = None
+# 模块级共享 HTTP 客户端：连接池 + keep-alive，免去每次查询的 TCP+TLS 握手；
+# HTTP/2 下实况和预报两个并发请求还能复用同一条连接多路复用。
+# 子进程随 MCP 生命周期退出，连接由进程回收，无需显式 aclose
+_client = httpx.AsyncClient(
+    http2=True,
+    base_url="https://restapi.amap.com",
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=10),
+)
+
+# 预热 DNS：启动时同步解析一次 AMap 域名，把结果留在系统 resolver 缓存里，
+# 首个真实查询少等一次解析往返。TLS 握手留给首个请求 ——
+# 此刻事件循环还没启动，提前建连会把连接绑到错误的 loop 上
+try:
+    socket.getaddrinfo("restapi.amap.com", 443)
+except OSError:
+    pass
+
+# 天气结果缓存：AMap 天气数据约 10 分钟更新一次，同一城市短时间内的
+# 重复查询语义上等价，直接复用结果，省掉两趟 HTTPS 往返
+_WEATHER_TTL = 600
+_weather_cache = {}  # (adcode, 时间桶) -> 结果文本
+
+# 加载城市编码表。
+# 启动时一次性转成 dict + list：精确匹配 O(1)，模糊匹配单遍线性扫，
+# 每次查询不再做两轮全列 pandas 扫描
+_exact = {}   # 中文名 -> adcode
+_names = []   # 兜底子串匹配用的名称/编码平行列表
+_codes = []
+_fuzzy = {}   # 去掉行政后缀的简称 -> adcode（按 市 > 区 > 县 优先级预排）
+
+# 行政后缀优先级：搜 "朝阳" 应命中 "朝阳市" (辽宁) 而不是 "朝阳区" (北京)
+_SUFFIX_RANK = {'市': 0, '区': 1, '县': 2, '省': 3}
+
+
+_automaton = None
+
+
+def _build_automaton(names, codes):
+    """把全部城市名编进一个自动机，扫一遍输入就能找出其中嵌着的表内名称"""
+    auto = ahocorasick.Automaton()
+    for name, code in zip(names, codes):
+        auto.add_word(name, (name, code))
+    auto.make_automaton()
+    return auto
+
+
+def _build_fuzzy_index(names, codes):
+    """简称索引构建一次，查询时一次哈希命中，替代整表子串扫描"""
+    ranked = sorted(
+        zip(names, codes),
+        key=lambda nc: (_SUFFIX_RANK.get(nc[0][-1], 3), len(nc[0])))
+    fuzzy = {}
+    for name, code in ranked:
+        if len(name) > 1 and name[-1] in _SUFFIX_RANK:
+            # setdefault：高优先级的先占坑
+            fuzzy.setdefault(name[:-1], code)
+    return fuzzy
+
+
+def _load_city_table(file_path):
+    """
+    加载城市编码表。XLSX 是 ZIP+XML，每次解析要上百毫秒，而 MCP 子进程
+    可能被反复拉起 —— 解析结果落成 .pkl 缓存，mtime 比源文件新就直接
+    反序列化；源表更新后自动重建。
+    """
+    cache_path = file_path + ".pkl"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+
+    # 用 openpyxl 流式读取即可，不必为一张查找表拉起整个 pandas
+    # （重量级 import，白添几百毫秒冷启动和几十 MB 常驻内存）
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    rows = wb.active.iter_rows(values_only=True)
+    header = next(rows)
+    name_idx = header.index("中文名")
+    code_idx = header.index("adcode")
+
+    names, codes = [], []
+    for row in rows:
+        name, code = row[name_idx], row[code_idx]
+        if name and code:
+            names.append(str(name))
+            # str() 兜底：adcode 列为文本，但数字单元格也不能丢前导零语义
+            codes.append(str(code))
+    wb.close()
+    table = (dict(zip(names, codes)), names, codes)
+
+    try:
+        with open(cache_path, "wb") as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass  # 只读文件系统等场景，退化为每次启动都解析
+    return table
+
+
 try:
     # 获取当前脚本所在目录 (tools/)
     base_dir = os.path.dirname(os.path.abspath(__file__))
     # 获取项目根目录
     root_dir = os.path.dirname(base_dir)
     file_path = os.path.join(root_dir, AMAP_ADCODE_FILE)
-    
+
     if os.path.exists(file_path):
-        # 指定 dtype={'adcode': str} 以防止前导零丢失
-        df_city = pd.read_excel(file_path, dtype={'adcode': str})
+        _exact, _names, _codes = _load_city_table(file_path)
+        _fuzzy = _build_fuzzy_index(_names, _codes)
+        if ahocorasick is not None:
+            _automaton = _build_automaton(_names, _codes)
     else:
         print(f"Warning: {file_path} not found.")
 except Exception as e:
     print(f"Error loading city codes: {e}")
 
+# 负缓存：查不到的城市名（口误/错字）也记下来，
+# 重复的无效输入不再反复走整表线性扫
+_neg_cache = set()
+
+
+@functools.lru_cache(maxsize=1024)
 def get_adcode(city_name: str) -> str:
-    if df_city is None:
+    # 编码表在进程内不变，记忆化无失效问题；
+    # 重复城市免去模糊匹配的整表线性扫
+    if city_name in _neg_cache:
         return None
-    
-    # 1. 尝试精确匹配中文名
-    match = df_city[df_city['中文名'] == city_name]
-    if not match.empty:
-        return match.iloc[0]['adcode']
-    
-    # 2. 尝试模糊匹配 (例如 "南京" -> "南京市")
-    # 过滤掉无效数据
-    valid_cities = df_city[df_city['中文名'].notna()]
-    match = valid_cities[valid_cities['中文名'].str.contains(city_name)]
-    
-    if not match.empty:
-        # 优先选择 "市" 结尾的，如果有很多匹配
-        # 比如搜 "朝阳"，可能有 "朝阳区" (北京) 和 "朝阳市" (辽宁)
-        # 这里简单取第一个，或者可以根据长度排序
-        return match.iloc[0]['adcode']
-        
-    return None
-
-@mcp.tool()
-async def get_weather(city: str) -> str:
+
+    # 1. 精确匹配中文名，O(1)
+    code = _exact.get(city_name)
+    if code:
+        return code
+
+    # 2. 预构建的简称索引 (例如 "南京" -> "南京市"、"河南" -> "河南省")，
+    #    以及显式补后缀的变体探测 —— 都是 O(1) 哈希，真实输入几乎
+    #    全在这里终结，不会落到线性扫
+    code = (_fuzzy.get(city_name)
+            or _exact.get(city_name + '市')
+            or _exact.get(city_name + '区'))
+    if code:
+        return code
+
+    # 3. 自动机扫描（可选依赖）：输入里若嵌着表内名称
+    #    （如 "北京市朝阳区" -> "朝阳区"），一次 C 级遍历找出全部命中，
+    #    按 市 > 区 > 县 > 省、名称更长者优先取一个
+    if _automaton is not None:
+        best_key, best_code = None, None
+        for _, (name, code) in _automaton.iter(city_name):
+            key = (_SUFFIX_RANK.get(name[-1], 4), -len(name))
+            if best_key is None or key < best_key:
+                best_key, best_code = key, code
+        if best_code:
+            return best_code
+
+    # 4. 兜底：任意子串匹配，整表线性扫（罕见路径，同样优先 "市" 结尾）
+    fallback = None
+    for i, name in enumerate(_names):
+        if city_name in name:
+            if name.endswith('市'):
+                return _codes[i]
+            if fallback is None:
+                fallback = _codes[i]
+    if fallback is None:
+        # 封顶防膨胀：极端情况下整体清掉重来即可
+        if len(_neg_cache) > 10000:
+            _neg_cache.clear()
+        _neg_cache.add(city_name)
+    return fallback
+
+async def get_weather(city: str, include_live: bool = False) -> str:
     """
-    查询指定城市的天气信息（包含实时天气和预报）。
-    
+    查询指定城市的天气信息（默认返回未来几天的天气预报）。
+
     Args:
         city: 城市中文名称（例如："南京", "北京"）
+        include_live: 是否额外附带实时天气（多一次 API 往返，
+            仅当调用方明确需要当前气温/天气实况时才开）
     """
-    if not AMAP_API_KEY or AMAP_API_KEY == "your_amap_api_key_here":
-        return "Error: AMAP_API_KEY not configured in .env file."
-        
     adcode = get_adcode(city)
     if not adcode:
         return f"Error: Could not find adcode for city '{city}'. Please try a more specific name (e.g., '南京市')."
 
-    async with httpx.AsyncClient() as client:
-        try:
-            base_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-            
-            # 1. 获取实时天气 (base)
+    # 同一 10 分钟时间桶内的重复查询直接命中缓存
+    bucket = int(time.time() // _WEATHER_TTL)
+    cache_key = (adcode, include_live, bucket)
+    cached = _weather_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        base_url = "/v3/weather/weatherInfo"
+
+        # 预报 (all) 一次就够：casts 覆盖当天与未来三天，行程规划用不到
+        # 实况字段。实况 (base) 只在明确要求时并发追加一趟 ——
+        # 默认路径请求数减半，还省 AMap 限流额度
+        all_params = {
+            "key": AMAP_API_KEY,
+            "city": adcode,
+            "extensions": "all",
+            "output": "JSON"
+        }
+        if include_live:
             base_params = {
                 "key": AMAP_API_KEY,
                 "city": adcode,
                 "extensions": "base",
                 "output": "JSON"
             }
-            resp_base = await client.get(base_url, params=base_params)
-            data_base = resp_base.json()
-            
-            if data_base.get("status") != "1":
-                return f"Error fetching live weather: {data_base.get('info')}"
-            
+            # return_exceptions: 实况失败不拖累预报主体
+            resp_all, resp_base = await asyncio.gather(
+                _client.get(base_url, params=all_params),
+                _client.get(base_url, params=base_params),
+                return_exceptions=True,
+            )
+        else:
+            resp_all = await _client.get(base_url, params=all_params)
+            resp_base = None
+
+        # 1. 预报天气 (all) —— 主体
+        if isinstance(resp_all, BaseException):
+            raise resp_all
+        # orjson 直接解析原始字节，比 stdlib json 快数倍
+        data_all = orjson.loads(resp_all.content)
+
+        if data_all.get("status") != "1":
+            return f"Error fetching weather: {data_all.get('info')}"
+
+        forecasts = data_all.get("forecasts", [])
+        if not forecasts:
+            return f"No forecast data found for {city}."
+
+        forecast_data = forecasts[0]
+        casts = forecast_data.get("casts", [])
+        if not casts:
+            return f"No casts data found for {city}."
+
+        # 2. 实况天气 (base) —— 可选附带，失败只是少一段
+        output_lines = []
+        if resp_base is not None and not isinstance(resp_base, BaseException):
+            data_base = orjson.loads(resp_base.content)
             lives = data_base.get("lives", [])
-            if not lives:
-                return f"No live weather data found for {city}."
-            
-            live_data = lives[0]
-            
-            # 2. 获取预报天气 (all)
-            all_params = {
-                "key": AMAP_API_KEY,
-                "city": adcode,
-                "extensions": "all",
-                "output": "JSON"
-            }
-            resp_all = await client.get(base_url, params=all_params)
-            data_all = resp_all.json()
-            
-            if data_all.get("status") != "1":
-                # 如果预报失败，至少返回实况
-                return f"Live Weather: {live_data.get('weather')}, {live_data.get('temperature')}C. (Forecast fetch failed)"
-                
-            forecasts = data_all.get("forecasts", [])
-            if not forecasts:
-                return f"Live Weather: {live_data.get('weather')}, {live_data.get('temperature')}C. (No forecast data)"
-                
-            forecast_data = forecasts[0]
-            casts = forecast_data.get("casts", [])
-            if not casts:
-                return f"Live Weather: {live_data.get('weather')}, {live_data.get('temperature')}C. (No casts data)"
-            
-            # 3. 组合结果
-            # 构建实况信息
-            output_lines = [
-                f"【{live_data.get('city')} 实时天气】",
-                f"天气: {live_data.get('weather')}",
-                f"气温: {live_data.get('temperature')}℃",
-                f"更新时间: {live_data.get('reporttime')}",
-                "",
-                f"【未来天气预报】"
-            ]
-
-            # 遍历所有预报数据 (通常包含当天及未来3天)
-            for cast in casts:
-                date_str = cast.get('date')
-                week_str = cast.get('week')
-                day_weather = cast.get('dayweather')
-                night_weather = cast.get('nightweather')
-                day_temp = cast.get('daytemp')
-                night_temp = cast.get('nighttemp')
-                
-                cast_line = (
-                    f"- {date_str} (星期{week_str}): "
-                    f"白天{day_weather}/{day_temp}℃, "
-                    f"晚上{night_weather}/{night_temp}℃。 "
-                )
-                output_lines.append(cast_line)
-            
-            return "\n".join(output_lines)
-
-        except Exception as e:
-            return f"Exception during weather query: {str(e)}"
+            if data_base.get("status") == "1" and lives:
+                live_data = lives[0]
+                output_lines += [
+                    f"【{live_data.get('city')} 实时天气】",
+                    f"天气: {live_data.get('weather')}",
+                    f"气温: {live_data.get('temperature')}℃",
+                    f"更新时间: {live_data.get('reporttime')}",
+                    "",
+                ]
+
+        # 3. 组合结果
+        output_lines.append(
+            f"【{forecast_data.get('city')} 天气预报】(更新于 {forecast_data.get('reporttime')})")
+
+        # 遍历所有预报数据 (通常包含当天及未来3天)。
+        # status == "1" 时 AMap 保证这些字段存在，直接下标取值即可
+        output_lines.extend(
+            f"- {c['date']} (星期{c['week']}): "
+            f"白天{c['dayweather']}/{c['daytemp']}℃, "
+            f"晚上{c['nightweather']}/{c['nighttemp']}℃。 "
+            for c in casts
+        )
+
+        output = "\n".join(output_lines)
+
+        # 淘汰旧时间桶的条目，字典不会无界增长
+        for key in list(_weather_cache):
+            if key[2] != bucket:
+                del _weather_cache[key]
+        _weather_cache[cache_key] = output
+        return output
+
+    except Exception as e:
+        return f"Exception during weather query: {str(e)}"
+
+
+async def _get_weather_unconfigured(city: str, include_live: bool = False) -> str:
+    return "Error: AMAP_API_KEY not configured in .env file."
+
+
+# API Key 在进程生命周期内不变，导入期判定一次即可：
+# 配置正常时热路径不再每次比较字符串，配置缺失也在启动时就暴露出来
+if AMAP_API_KEY and AMAP_API_KEY != "your_amap_api_key_here":
+    mcp.tool()(get_weather)
+else:
+    print("Warning: AMAP_API_KEY not configured in .env file.")
+    _get_weather_unconfigured.__doc__ = get_weather.__doc__
+    mcp.tool(name="get_weather")(_get_weather_unconfigured)
 
 if __name__ == "__main__":
+    # 可选：uvloop 用 libuv 替换默认事件循环，纯异步 I/O 负载下
+    # 调度开销明显更低；没装就用标准 asyncio，行为不变
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     # 这是 MCP Server 的标准入口，它会接管 Stdin/Stdout
     mcp.run()
\ No newline at end of file